@@ -1,5 +1,23 @@
-from typing import Set, Dict, Tuple, Optional, Any
+from typing import Set, FrozenSet, Dict, List, Tuple, Optional, Any, Callable
+from collections import deque
+import io
 import json
+import re
+import weakref
+
+# orjson is an optional, faster JSON backend; fall back to the stdlib
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, indent=2).encode("utf-8")
+
+    _loads = json.loads
 
 # Import the KripkeModel class from the first document
 class KripkeModel:
@@ -7,14 +25,28 @@ class KripkeModel:
     A complete Kripke model for modal logic evaluation.
     Supports worlds (W), accessibility relations (R), and valuations (V).
     Includes serialization, validation, and advanced query methods.
+    W, R and V are indexed for evaluation: change them through the methods
+    below, or call validate_model() after editing them directly.
     """
 
+    __slots__ = ("W", "R", "V", "_default_valuation", "_succ", "_pred",
+                 "_is_validated", "_world_idx", "_worlds", "_prop_mask",
+                 "_prop_defined", "_rel_bits")
+
     def __init__(self):
         """Initialize an empty Kripke model."""
         self.W: Set[str] = set()               # Worlds (e.g., {"w1", "w2"})
         self.R: Set[Tuple[str, str]] = set()   # Relations (e.g., {("w1", "w2")})
         self.V: Dict[str, Dict[str, bool]] = {} # Valuations (e.g., {"w1": {"p": True}})
         self._default_valuation = False        # Default truth value for undefined props
+        self._succ: Dict[str, Set[str]] = {}   # Adjacency index: world -> successors
+        self._pred: Dict[str, Set[str]] = {}   # Reverse index: world -> predecessors
+        self._is_validated = False             # Cleared by every mutation
+        self._world_idx: Dict[str, int] = {}   # World numbering: world -> bit index
+        self._worlds: List[str] = []           # Bit index -> world
+        self._prop_mask: Dict[str, int] = {}   # Prop -> bitset of worlds where it is True
+        self._prop_defined: Dict[str, int] = {} # Prop -> bitset of worlds where it is set
+        self._rel_bits: Optional[Tuple[List[int], List[int]]] = None # (successor, predecessor) rows, built lazily
 
     # === World Management ===
     def add_world(self, world: str) -> None:
@@ -22,16 +54,34 @@ class KripkeModel:
         if not isinstance(world, str):
             raise TypeError("World must be a string.")
         self.W.add(world)
+        self._is_validated = False
         if world not in self.V:
             self.V[world] = {}
+        self._succ.setdefault(world, set())
+        self._pred.setdefault(world, set())
+        self._rel_bits = None
+        if world not in self._world_idx:
+            self._world_idx[world] = len(self._worlds)
+            self._worlds.append(world)
+            for prop, value in self.V[world].items():
+                self._set_prop_bit(world, prop, value)
 
     def remove_world(self, world: str) -> None:
         """Remove a world and all its relations/valuations."""
         if world not in self.W:
             raise ValueError(f"World '{world}' does not exist.")
         self.W.remove(world)
-        self.R = {(w1, w2) for (w1, w2) in self.R if w1 != world and w2 != world}
+        self._is_validated = False
+        for w2 in self._succ.pop(world, ()):
+            self.R.discard((world, w2))
+            if w2 != world:
+                self._pred[w2].discard(world)
+        for w1 in self._pred.pop(world, ()):
+            self.R.discard((w1, world))
+            if w1 != world:
+                self._succ[w1].discard(world)
         del self.V[world]
+        self._reindex_worlds()
 
     # === Relation Management ===
     def add_relation(self, source: str, target: str) -> None:
@@ -39,33 +89,152 @@ class KripkeModel:
         if source not in self.W or target not in self.W:
             raise ValueError("Both worlds must exist.")
         self.R.add((source, target))
+        self._is_validated = False
+        self._rel_bits = None
+        self._succ[source].add(target)
+        self._pred[target].add(source)
 
     def remove_relation(self, source: str, target: str) -> None:
         """Remove a specific accessibility relation."""
         if (source, target) not in self.R:
             raise ValueError(f"Relation ({source}, {target}) does not exist.")
         self.R.remove((source, target))
+        self._is_validated = False
+        self._rel_bits = None
+        self._succ[source].discard(target)
+        self._pred[target].discard(source)
 
     def make_relation_reflexive(self) -> None:
         """Ensure every world accesses itself (for T/S4/S5 logics)."""
+        self._is_validated = False
+        self._rel_bits = None
+        self.R.update([(w, w) for w in self.W])
         for w in self.W:
-            self.R.add((w, w))
+            self._succ[w].add(w)
+            self._pred[w].add(w)
 
     def make_relation_symmetric(self) -> None:
         """Ensure all relations are bidirectional (for B/S5 logics)."""
-        for (w1, w2) in list(self.R):
-            self.R.add((w2, w1))
+        self._is_validated = False
+        self._rel_bits = None
+        self.R.update([(w2, w1) for (w1, w2) in self.R])
+        # In the symmetric closure both indices become successors ∪ predecessors
+        for w, succ in self._succ.items():
+            pred = self._pred[w]
+            succ |= pred
+            pred |= succ
 
     def make_relation_transitive(self) -> None:
         """Ensure relations are transitive (for S4/S5 logics)."""
-        changed = True
-        while changed:
-            changed = False
-            for (w1, w2) in list(self.R):
-                for (w3, w4) in list(self.R):
-                    if w2 == w3 and (w1, w4) not in self.R:
-                        self.R.add((w1, w4))
-                        changed = True
+        self.apply_closures(transitive=True)
+
+    def apply_closures(self, reflexive: bool = False, symmetric: bool = False,
+                       transitive: bool = False) -> None:
+        """
+        Apply the requested closures in the order reflexive, symmetric,
+        transitive (the result is then e.g. S5's equivalence relation).
+        Without `transitive` the set-based closures above are used; with it,
+        R is converted to bitset rows once and back once.
+        Raises ValueError for an invalid model (a pair of R off W).
+        """
+        _require_valid_model(self)
+        if not transitive:
+            if reflexive:
+                self.make_relation_reflexive()
+            if symmetric:
+                self.make_relation_symmetric()
+            return
+        inv, succ, pred, _ = self._to_bitsets()
+        succ = list(succ)  # The cached rows are shared: work on a copy
+        n = len(inv)
+        if reflexive:
+            for i in range(n):
+                succ[i] |= 1 << i
+        if symmetric:
+            # Symmetric closure: each world's successors ∪ predecessors
+            for i in range(n):
+                succ[i] |= pred[i]
+        # Warshall: whoever reaches k also reaches everything k reaches
+        for k in range(n):
+            bk = 1 << k
+            rk = succ[k]
+            for i in range(n):
+                if succ[i] & bk:
+                    succ[i] |= rk
+        # Back to pairs, visiting only the set bits of each row
+        R = set()
+        for world, row in zip(inv, succ):
+            while row:
+                low = row & -row
+                R.add((world, inv[low.bit_length() - 1]))
+                row ^= low
+        self.R = R
+        self._rebuild_index()
+        self._is_validated = False
+
+    def _index_worlds(self) -> Tuple[Dict[str, int], List[str]]:
+        """Numbering of the worlds 0..n-1: (world -> index, index -> world)."""
+        return self._world_idx, self._worlds
+
+    def _to_bitsets(self, props: Tuple[str, ...] = ()) -> Tuple[List[str], List[int], List[int], List[int]]:
+        """
+        Integer encoding of the model: (index -> world, successor bitset of each
+        world, predecessor bitset of each world, bitset of the worlds satisfying
+        each of `props`). Bit j of a bitset stands for world inv[j].
+        The relation rows are cached until the relation changes and must not
+        be mutated.
+        """
+        idx, inv = self._index_worlds()
+        if self._rel_bits is None:
+            succ = [0] * len(inv)
+            pred = [0] * len(inv)
+            for (w1, w2) in self.R:
+                i, j = idx[w1], idx[w2]
+                succ[i] |= 1 << j
+                pred[j] |= 1 << i
+            self._rel_bits = (succ, pred)
+        succ, pred = self._rel_bits
+        prop_val = [self._prop_worlds(prop) for prop in props]
+        return inv, succ, pred, prop_val
+
+    def _rebuild_index(self) -> None:
+        """Recompute the successor/predecessor indices from W and R."""
+        self._succ = {w: set() for w in self.W}
+        self._pred = {w: set() for w in self.W}
+        for (w1, w2) in self.R:
+            self._succ.setdefault(w1, set()).add(w2)
+            self._pred.setdefault(w2, set()).add(w1)
+        self._rel_bits = None
+
+    def _reindex_worlds(self) -> None:
+        """
+        Renumber the worlds 0..n-1 and recompute the proposition bitsets from V.
+        Worlds are numbered in sorted order, so equal (W, R, V) always give
+        the same bit positions, e.g. in models rebuilt by `from_snapshot`.
+        """
+        self._worlds = sorted(self.W)
+        self._world_idx = {w: i for i, w in enumerate(self._worlds)}
+        self._rel_bits = None
+        self._prop_mask = {}
+        self._prop_defined = {}
+        for world in self._worlds:
+            for prop, value in self.V.get(world, {}).items():
+                self._set_prop_bit(world, prop, value)
+
+    def _set_prop_bit(self, world: str, prop: str, value: bool) -> None:
+        """Record `value` for `prop` at the bit of `world` in the proposition bitsets."""
+        b = 1 << self._world_idx[world]
+        self._prop_defined[prop] = self._prop_defined.get(prop, 0) | b
+        m = self._prop_mask.get(prop, 0)
+        self._prop_mask[prop] = (m | b) if value else (m & ~b)
+
+    def _prop_worlds(self, prop: str) -> int:
+        """Bitset of the worlds where `prop` holds, the default valuation included."""
+        mask = self._prop_mask.get(prop, 0)
+        if self._default_valuation:
+            full = (1 << len(self._worlds)) - 1
+            mask |= full & ~self._prop_defined.get(prop, 0)
+        return mask
 
     # === Valuation Management ===
     def set_valuation(self, world: str, prop: str, value: bool) -> None:
@@ -75,60 +244,84 @@ class KripkeModel:
         if not isinstance(prop, str):
             raise TypeError("Proposition must be a string.")
         self.V[world][prop] = value
+        self._set_prop_bit(world, prop, value)
+        self._is_validated = False
 
     def get_valuation(self, world: str, prop: str) -> bool:
         """Get the truth value of `prop` in `world` (default: False)."""
-        return self.V.get(world, {}).get(prop, self._default_valuation)
+        i = self._world_idx.get(world)
+        if i is None or not self._prop_defined.get(prop, 0) >> i & 1:
+            return self._default_valuation
+        return bool(self._prop_mask[prop] >> i & 1)
 
     def set_default_valuation(self, default: bool) -> None:
         """Set default truth value for undefined propositions."""
         self._default_valuation = default
 
     # === Model Queries ===
-    def get_accessible_worlds(self, world: str) -> Set[str]:
-        """Get all worlds accessible from `world`."""
-        return {w2 for (w1, w2) in self.R if w1 == world}
+    def get_accessible_worlds(self, world: str) -> FrozenSet[str]:
+        """Get all worlds accessible from `world` (a copy: the index stays intact)."""
+        return frozenset(self._succ.get(world, ()))
 
     def is_world_reachable(self, start: str, target: str, max_steps: int = 100) -> bool:
         """Check if `target` is reachable from `start` in ≤ `max_steps`."""
-        visited = set()
-        stack = [(start, 0)]
-        while stack:
-            current, steps = stack.pop()
+        # Breadth-first, so every world is first reached by a shortest path
+        visited = {start}
+        queue = deque([(start, 0)])
+        while queue:
+            current, steps = queue.popleft()
             if current == target:
                 return True
             if steps >= max_steps:
                 continue
-            for (w1, w2) in self.R:
-                if w1 == current and w2 not in visited:
+            for w2 in self._succ.get(current, ()):
+                if w2 not in visited:
                     visited.add(w2)
-                    stack.append((w2, steps + 1))
+                    queue.append((w2, steps + 1))
         return False
 
     def validate_model(self) -> bool:
-        """Check if the model is consistent (no dangling relations)."""
+        """
+        Check if the model is consistent (no dangling relations).
+        The indices are rebuilt from W, R and V first, so direct edits of
+        those sets are picked up by later evaluations.
+        """
+        self._rebuild_index()
+        self._reindex_worlds()
+        self._is_validated = self._check_model()
+        return self._is_validated
+
+    def _check_model(self) -> bool:
+        """Consistency check of `validate_model`, on the current indices."""
+        W = self.W
         for (w1, w2) in self.R:
-            if w1 not in self.W or w2 not in self.W:
+            if w1 not in W or w2 not in W:
                 return False
-        for world in self.V:
-            if world not in self.W:
-                return False
-        return True
+        return self.V.keys() <= W
 
     # === Serialization ===
     def to_dict(self) -> Dict[str, Any]:
         """Export the model to a dictionary (for JSON)."""
         return {
             "W": list(self.W),
-            "R": [list(pair) for pair in self.R],
+            "R": list(map(list, self.R)),
             "V": {w: props for w, props in self.V.items()},
             "default_valuation": self._default_valuation
         }
 
+    def snapshot(self) -> Tuple[FrozenSet[str], FrozenSet[Tuple[str, str]], FrozenSet[Tuple[str, str, bool]], bool]:
+        """Hashable copy of the model's content, e.g. as a cache key."""
+        return (
+            frozenset(self.W),
+            frozenset(self.R),
+            frozenset((w, p, bool(v)) for w, props in self.V.items() for p, v in props.items()),
+            self._default_valuation
+        )
+
     def save_to_json(self, filepath: str) -> None:
         """Save the model to a JSON file."""
-        with open(filepath, 'w') as f:
-            json.dump(self.to_dict(), f, indent=2)
+        with open(filepath, 'wb') as f:
+            f.write(_dumps(self.to_dict()))
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'KripkeModel':
@@ -138,184 +331,616 @@ class KripkeModel:
         model.R = {tuple(pair) for pair in data["R"]}
         model.V = data["V"]
         model._default_valuation = data.get("default_valuation", False)
+        model._rebuild_index()
+        model._reindex_worlds()
+        return model
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Tuple[FrozenSet[str], FrozenSet[Tuple[str, str]],
+                                           FrozenSet[Tuple[str, str, bool]], bool]) -> 'KripkeModel':
+        """Rebuild a model from the output of `snapshot()`."""
+        worlds, relations, valuations, default = snapshot
+        model = cls()
+        model.W = set(worlds)
+        model.R = set(relations)
+        model.V = {w: {} for w in worlds}
+        for world, prop, value in valuations:
+            # setdefault: a loaded model may value worlds that are not in W
+            model.V.setdefault(world, {})[prop] = value
+        model._default_valuation = default
+        model._rebuild_index()
+        model._reindex_worlds()
         return model
 
     @classmethod
     def load_from_json(cls, filepath: str) -> 'KripkeModel':
         """Load a model from a JSON file."""
-        with open(filepath, 'r') as f:
-            data = json.load(f)
+        with open(filepath, 'rb') as f:
+            data = _loads(f.read())
         return cls.from_dict(data)
 
     # === Debugging ===
     def __str__(self) -> str:
         """Pretty-print the model."""
-        worlds = sorted(self.W)
-        relations = sorted(self.R)
-        valuations = []
-        for world in sorted(self.V.keys()):
-            props = [f"{p}:{'T' if v else 'F'}" for p, v in self.V[world].items()]
-            valuations.append(f"{world}: {{{', '.join(props)}}}")
-        return (
-            f"Kripke Model:\n"
-            f"Worlds: {{{', '.join(worlds)}}}\n"
-            f"Relations: {{{', '.join(f'({w1}→{w2})' for (w1, w2) in relations)}}}\n"
-            f"Valuations:\n  " + "\n  ".join(valuations)
-        )
+        worlds = sorted(self.W)  # Sorted once, reused for the valuations
+        buf = io.StringIO()
+        buf.write("Kripke Model:\nWorlds: {")
+        buf.write(", ".join(worlds))
+        buf.write("}\nRelations: {")
+        buf.write(", ".join([f"({w1}→{w2})" for (w1, w2) in sorted(self.R)]))
+        buf.write("}\nValuations:")
+        for world in worlds:
+            buf.write(f"\n  {world}: {{")
+            buf.write(", ".join([f"{p}:T" if v else f"{p}:F"
+                                 for p, v in self.V.get(world, {}).items()]))
+            buf.write("}")
+        if not worlds:
+            buf.write("\n  ")
+        return buf.getvalue()
+
+# Opcodes of the compiled (postfix) form of a formula; each Formula class
+# carries its own as the integer tag `_op`
+(_OP_PROP, _OP_NOT, _OP_AND, _OP_OR, _OP_IMPLIES, _OP_BOX, _OP_DIAMOND,
+ _OP_STORE, _OP_LOAD) = range(9)
 
 # Import the Formula classes from the second document
 class Formula:
-    pass  # Base class
+    """
+    Base class. Nodes are immutable: equality is structural, and each node
+    computes its hash once from its class and its children's hashes.
+    Operand type checks are asserts, so `python -O` skips them.
+    """
+    __slots__ = ("_hash", "__weakref__")
+    _fields: Tuple[str, ...] = ()
+    _op: Optional[int] = None
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(self) is not type(other) or self._hash != other._hash:
+            return False
+        return all(getattr(self, f) == getattr(other, f) for f in self._fields)
+
+    def __reduce__(self):
+        # Rebuild through the constructor so the hash is recomputed on load
+        return (type(self), tuple(getattr(self, f) for f in self._fields))
 
 class Prop(Formula):
+    __slots__ = _fields = ("name",)
+    _op = _OP_PROP
     def __init__(self, name):
         self.name = name
+        self._hash = hash((Prop, name))
     def __repr__(self):
         return self.name
 
 class Not(Formula):
+    __slots__ = _fields = ("operand",)
+    _op = _OP_NOT
     def __init__(self, operand):
-        if not isinstance(operand, Formula): raise TypeError("Operand must be a Formula")
+        assert isinstance(operand, Formula), "Operand must be a Formula"
         self.operand = operand
+        self._hash = hash((Not, operand))
     def __repr__(self):
         return f"¬{self.operand}"
 
 class And(Formula):
+    __slots__ = _fields = ("left", "right")
+    _op = _OP_AND
     def __init__(self, left, right):
-        if not isinstance(left, Formula): raise TypeError("Left operand must be a Formula")
-        if not isinstance(right, Formula): raise TypeError("Right operand must be a Formula")
+        assert isinstance(left, Formula), "Left operand must be a Formula"
+        assert isinstance(right, Formula), "Right operand must be a Formula"
         self.left = left
         self.right = right
+        self._hash = hash((And, left, right))
     def __repr__(self):
         return f"({self.left} ∧ {self.right})"
 
 class Or(Formula):
+    __slots__ = _fields = ("left", "right")
+    _op = _OP_OR
     def __init__(self, left, right):
-        if not isinstance(left, Formula): raise TypeError("Left operand must be a Formula")
-        if not isinstance(right, Formula): raise TypeError("Right operand must be a Formula")
+        assert isinstance(left, Formula), "Left operand must be a Formula"
+        assert isinstance(right, Formula), "Right operand must be a Formula"
         self.left = left
         self.right = right
+        self._hash = hash((Or, left, right))
     def __repr__(self):
         return f"({self.left} ∨ {self.right})"
 
 class Implies(Formula):
+    __slots__ = _fields = ("left", "right")
+    _op = _OP_IMPLIES
     def __init__(self, left, right):
-        if not isinstance(left, Formula): raise TypeError("Left operand must be a Formula")
-        if not isinstance(right, Formula): raise TypeError("Right operand must be a Formula")
+        assert isinstance(left, Formula), "Left operand must be a Formula"
+        assert isinstance(right, Formula), "Right operand must be a Formula"
         self.left = left
         self.right = right
+        self._hash = hash((Implies, left, right))
     def __repr__(self):
         return f"({self.left} → {self.right})"
 
 class Box(Formula):  # Necessarily (□)
+    __slots__ = _fields = ("operand",)
+    _op = _OP_BOX
     def __init__(self, operand):
-        if not isinstance(operand, Formula): raise TypeError("Operand must be a Formula")
+        assert isinstance(operand, Formula), "Operand must be a Formula"
         self.operand = operand
+        self._hash = hash((Box, operand))
     def __repr__(self):
         return f"□{self.operand}"
 
 class Diamond(Formula):  # Possibly (◇)
+    __slots__ = _fields = ("operand",)
+    _op = _OP_DIAMOND
     def __init__(self, operand):
-        if not isinstance(operand, Formula): raise TypeError("Operand must be a Formula")
+        assert isinstance(operand, Formula), "Operand must be a Formula"
         self.operand = operand
+        self._hash = hash((Diamond, operand))
     def __repr__(self):
         return f"◇{self.operand}"
 
+# Hash-consing: the mk_* factories return one shared node per distinct
+# formula, so equal subformulas are the same object and id()-keyed caches
+# recognise them. Keys use child ids; a live node keeps its children alive.
+_interned = weakref.WeakValueDictionary()
+
+def _intern(key: tuple, cls, *args) -> Formula:
+    node = _interned.get(key)
+    if node is None:
+        node = cls(*args)
+        _interned[key] = node
+    return node
+
+def mk_prop(name: str) -> Prop:
+    return _intern((Prop, name), Prop, name)
+
+def mk_not(operand: Formula) -> Not:
+    return _intern((Not, id(operand)), Not, operand)
+
+def mk_and(left: Formula, right: Formula) -> And:
+    return _intern((And, id(left), id(right)), And, left, right)
+
+def mk_or(left: Formula, right: Formula) -> Or:
+    return _intern((Or, id(left), id(right)), Or, left, right)
+
+def mk_implies(left: Formula, right: Formula) -> Implies:
+    return _intern((Implies, id(left), id(right)), Implies, left, right)
+
+def mk_box(operand: Formula) -> Box:
+    return _intern((Box, id(operand)), Box, operand)
+
+def mk_diamond(operand: Formula) -> Diamond:
+    return _intern((Diamond, id(operand)), Diamond, operand)
+
+# Connective symbols -> token kinds
+_SYMBOLS = {
+    '¬': 'NOT', '□': 'BOX', '◇': 'DIA',
+    '∧': 'AND', '∨': 'OR', '→': 'IMP',
+    '(': 'LP', ')': 'RP',
+}
+
+_UNARY = {'NOT': mk_not, 'BOX': mk_box, 'DIA': mk_diamond}
+
+# One match per token: group 1 a connective or parenthesis, group 2 a
+# proposition name (any run of other non-space characters)
+_SYMBOL_CLASS = "".join(map(re.escape, _SYMBOLS))
+_TOKEN_RE = re.compile(f"([{_SYMBOL_CLASS}])|([^\\s{_SYMBOL_CLASS}]+)")
+
+def _tokenize(formula_str: str) -> List[Tuple[str, str, int]]:
+    """
+    Split a formula into tokens in a single pass: (kind, text, offset), with
+    kind 'PROP' for propositions and the _SYMBOLS kind for connectives and
+    parentheses. `text` and `offset` are what the user typed, for errors.
+    """
+    return [(_SYMBOLS[m.group(1)] if m.group(1) else 'PROP', m.group(), m.start())
+            for m in _TOKEN_RE.finditer(formula_str)]
+
+def _unexpected(token: Tuple[str, str, int]) -> ValueError:
+    """Parse error for `token`, naming the text typed and its 1-based position."""
+    return ValueError(f"unexpected '{token[1]}' at position {token[2] + 1}")
+
+def _parse_implies(tokens, pos):
+    """implies := or ('→' implies)?   (right-associative)"""
+    left, pos = _parse_or(tokens, pos)
+    if pos < len(tokens) and tokens[pos][0] == 'IMP':
+        right, pos = _parse_implies(tokens, pos + 1)
+        return mk_implies(left, right), pos
+    return left, pos
+
+def _parse_or(tokens, pos):
+    """or := and ('∨' and)*"""
+    left, pos = _parse_and(tokens, pos)
+    while pos < len(tokens) and tokens[pos][0] == 'OR':
+        right, pos = _parse_and(tokens, pos + 1)
+        left = mk_or(left, right)
+    return left, pos
+
+def _parse_and(tokens, pos):
+    """and := unary ('∧' unary)*"""
+    left, pos = _parse_unary(tokens, pos)
+    while pos < len(tokens) and tokens[pos][0] == 'AND':
+        right, pos = _parse_unary(tokens, pos + 1)
+        left = mk_and(left, right)
+    return left, pos
+
+def _parse_unary(tokens, pos):
+    """unary := ('¬' | '□' | '◇')* atom"""
+    ops = []
+    while pos < len(tokens) and tokens[pos][0] in _UNARY:
+        ops.append(_UNARY[tokens[pos][0]])
+        pos += 1
+    node, pos = _parse_atom(tokens, pos)
+    for op in reversed(ops):
+        node = op(node)
+    return node, pos
+
+def _parse_atom(tokens, pos):
+    """atom := PROP | '(' implies ')'"""
+    if pos >= len(tokens):
+        raise ValueError("unexpected end of formula")
+    token = tokens[pos]
+    if token[0] == 'PROP':
+        return mk_prop(token[1]), pos + 1
+    if token[0] == 'LP':
+        node, pos = _parse_implies(tokens, pos + 1)
+        if pos >= len(tokens) or tokens[pos][0] != 'RP':
+            raise ValueError(f"missing ')' for the '(' at position {token[2] + 1}")
+        return node, pos + 1
+    raise _unexpected(token)
+
 def parse_simple_formula(formula_str):
-    """Tente de parser une formule simple (non recommandé pour des cas complexes)."""
-    formula_str = formula_str.strip()
-
-    # Basic case: Proposition
-    if ' ' not in formula_str and not any(op in formula_str for op in ['¬', '□', '◇', '∧', '∨', '→', '(', ')']):
-        return Prop(formula_str)
-
-    # Unary prefix operators
-    if formula_str.startswith('¬'):
-        return Not(parse_simple_formula(formula_str[1:]))
-    if formula_str.startswith('□'):
-        return Box(parse_simple_formula(formula_str[1:]))
-    if formula_str.startswith('◇'):
-        return Diamond(parse_simple_formula(formula_str[1:]))
-
-    # Simple handling of external parentheses
-    if formula_str.startswith('(') and formula_str.endswith(')'):
-        return parse_simple_formula(formula_str[1:-1])
-
-    # Search for binary operators
-    if '→' in formula_str:
-        split_pos = formula_str.rfind('→')
-        left = parse_simple_formula(formula_str[:split_pos].strip())
-        right = parse_simple_formula(formula_str[split_pos+1:].strip())
-        return Implies(left, right)
-
-    if '∨' in formula_str:
-        split_pos = formula_str.rfind('∨')
-        left = parse_simple_formula(formula_str[:split_pos].strip())
-        right = parse_simple_formula(formula_str[split_pos+1:].strip())
-        return Or(left, right)
-
-    if '∧' in formula_str:
-        split_pos = formula_str.rfind('∧')
-        left = parse_simple_formula(formula_str[:split_pos].strip())
-        right = parse_simple_formula(formula_str[split_pos+1:].strip())
-        return And(left, right)
-
-    raise ValueError(f"Cannot parse formula: '{formula_str}'")
+    """
+    Tente de parser une formule modale.
+    Precedence, from tightest to loosest: ¬ □ ◇, then ∧, then ∨, then →
+    (right-associative). Raises ValueError on malformed input.
+    """
+    # Positions in the messages count from the start of the quoted text
+    text = formula_str.strip()
+    tokens = _tokenize(text)
+    try:
+        node, pos = _parse_implies(tokens, 0)
+        if pos != len(tokens):
+            raise _unexpected(tokens[pos])
+    except ValueError as e:
+        raise ValueError(f"Cannot parse formula: '{text}' ({e})") from None
+    return node
+
+# Simplified form per formula, dropped when the formula is garbage collected.
+# A formula that is already simple maps to `_SIMPLE`, not to itself: a value
+# referring to its own key would keep the weak entry (and the formula) alive.
+# Any other value is rebuilt from the key's subformulas and never contains it.
+_simplified = weakref.WeakKeyDictionary()
+_SIMPLE = object()
+
+def simplify_formula(formula: Formula) -> Formula:
+    """
+    Return an equivalent formula with redundant subformulas removed:
+    ¬¬φ becomes φ, repeated operands of a chain of ∧ (or of ∨) are dropped,
+    and absorbed operands go (φ ∧ (φ ∨ ψ) becomes φ, and dually for ∨).
+    """
+    result = _simplified.get(formula)
+    if result is None:
+        result = _simplify(formula)
+        _simplified[formula] = _SIMPLE if result is formula else result
+    elif result is _SIMPLE:
+        result = formula
+    return result
+
+def _simplify(formula: Formula) -> Formula:
+    """Worker of `simplify_formula`: simplify the children, then the node."""
+    op = getattr(formula, "_op", None)
+    if op == _OP_PROP:
+        return formula
+    if op is None:
+        raise TypeError(f"Unknown formula type: {type(formula)}")
+    if op == _OP_NOT:
+        operand = simplify_formula(formula.operand)
+        return operand.operand if operand._op == _OP_NOT else mk_not(operand)
+    if op in (_OP_AND, _OP_OR):
+        return _simplify_chain(formula, op)
+    if op == _OP_IMPLIES:
+        return mk_implies(simplify_formula(formula.left), simplify_formula(formula.right))
+    return (mk_box if op == _OP_BOX else mk_diamond)(simplify_formula(formula.operand))
+
+def _simplify_chain(formula: Formula, op: int) -> Formula:
+    """Flatten a chain of ∧ (or ∨), dedupe and absorb its operands, rebuild it."""
+    dual = _OP_OR if op == _OP_AND else _OP_AND
+    operands: List[Formula] = []
+    todo = [formula]
+    while todo:
+        node = todo.pop()
+        if node._op == op:
+            todo.extend((node.right, node.left))
+            continue
+        node = simplify_formula(node)
+        if node._op == op:  # ¬¬(φ ∧ ψ) simplifies into the chain
+            todo.append(node)
+        elif node not in operands:
+            operands.append(node)
+    # Absorption: φ ∧ (φ ∨ ψ) = φ, φ ∨ (φ ∧ ψ) = φ
+    kept = set(operands)
+    operands = [node for node in operands
+                if node._op != dual or not any(_chain_has(node, dual, other)
+                                               for other in kept if other is not node)]
+    mk = mk_and if op == _OP_AND else mk_or
+    result = operands[0]
+    for node in operands[1:]:
+        result = mk(result, node)
+    return result
+
+def _chain_has(formula: Formula, op: int, target: Formula) -> bool:
+    """Whether `target` is an operand of the chain of `op` rooted at `formula`."""
+    todo = [formula]
+    while todo:
+        node = todo.pop()
+        if node == target:
+            return True
+        if node._op == op:
+            todo.extend((node.left, node.right))
+    return False
 
 # New function to evaluate modal formulas in a Kripke model
 def evaluate_formula(model: KripkeModel, formula: Formula, world: str) -> bool:
     """
     Evaluate a modal formula in a specified world of a Kripke model.
     Returns True if the formula is satisfied in the world, False otherwise.
+    Reads the world's bit of `evaluate_formula_set`'s world bitset.
     """
-    if not model.validate_model():
-        raise ValueError("Invalid Kripke model")
+    _require_valid_model(model)
     
     if world not in model.W:
         raise ValueError(f"World '{world}' does not exist in the model")
     
-    # Base case: Proposition
-    if isinstance(formula, Prop):
-        return model.get_valuation(world, formula.name)
-    
-    # Negation
-    elif isinstance(formula, Not):
-        return not evaluate_formula(model, formula.operand, world)
-    
-    # Conjunction
-    elif isinstance(formula, And):
-        return (evaluate_formula(model, formula.left, world) and 
-                evaluate_formula(model, formula.right, world))
-    
-    # Disjunction
-    elif isinstance(formula, Or):
-        return (evaluate_formula(model, formula.left, world) or 
-                evaluate_formula(model, formula.right, world))
-    
-    # Implication
-    elif isinstance(formula, Implies):
-        return (not evaluate_formula(model, formula.left, world) or 
-                evaluate_formula(model, formula.right, world))
+    idx, _ = model._index_worlds()
+    return bool(_satisfying_mask(model, formula)[1] >> idx[world] & 1)
+
+def _require_valid_model(model: KripkeModel) -> None:
+    """Raise ValueError for an invalid model; skip the check if nothing changed since the last one."""
+    if not model._is_validated:
+        if not model._check_model():
+            raise ValueError("Invalid Kripke model")
+        model._is_validated = True
+
+def evaluate_formula_in_all_worlds(model: KripkeModel, formula: Formula,
+                                   memo: Optional[Dict[Formula, int]] = None) -> Dict[str, bool]:
+    """
+    Evaluate a formula in all worlds of the model.
+    Returns a dictionary mapping world names to truth values.
+    `memo`, if given, maps subformulas to their world bitsets and is shared
+    between calls: a subformula already in it is not evaluated again. It is
+    only valid for one state of the model; use a fresh dict after a change.
+    """
+    inv, mask = _satisfying_mask(model, formula, memo)
+    return {world: bool(mask >> i & 1) for i, world in enumerate(inv)}
+
+def evaluate_formula_set(model: KripkeModel, formula: Formula,
+                         memo: Optional[Dict[Formula, int]] = None) -> Set[str]:
+    """
+    Return the set of worlds of the model where the formula holds.
+    Computed bottom-up in one pass: Box/Diamond become subset/intersection
+    tests between each world's successors and the operand's world set.
+    `memo` is as in `evaluate_formula_in_all_worlds`.
+    """
+    inv, mask = _satisfying_mask(model, formula, memo)
+    return {world for i, world in enumerate(inv) if mask >> i & 1}
+
+def _satisfying_mask(model: KripkeModel, formula: Formula,
+                     memo: Optional[Dict[Formula, int]] = None) -> Tuple[List[str], int]:
+    """(index -> world, bitset of the worlds where `formula` holds)."""
+    _require_valid_model(model)
     
-    # Box (Necessity) operator: true if formula is true in all accessible worlds
-    elif isinstance(formula, Box):
-        accessible_worlds = model.get_accessible_worlds(world)
-        return all(evaluate_formula(model, formula.operand, w) for w in accessible_worlds)
+    if memo is not None:
+        inv, succ, pred, _ = model._to_bitsets()
+        return inv, _memo_mask(model, formula, memo, succ, pred)
+    run, props = _compiled_function(formula)
+    inv, succ, pred, prop_val = model._to_bitsets(props)
+    return inv, run(prop_val, succ, pred)
+
+def _memo_mask(model: KripkeModel, formula: Formula, memo: Dict[Formula, int],
+               succ: List[int], pred: List[int]) -> int:
+    """
+    Bitset of the worlds where `formula` holds, reusing and filling `memo`.
+    Structurally equal subformulas are equal keys, so a subtree shared by
+    several formulas is computed once for all of them.
+    """
+    mask = memo.get(formula)
+    if mask is not None:
+        return mask
+    op = getattr(formula, "_op", None)
+    if op == _OP_PROP:
+        mask = model._prop_worlds(formula.name)
+    elif op is None:
+        raise TypeError(f"Unknown formula type: {type(formula)}")
+    else:
+        full = (1 << len(succ)) - 1
+        args = [_memo_mask(model, getattr(formula, f), memo, succ, pred)
+                for f in formula._fields]
+        if op == _OP_NOT:
+            mask = full ^ args[0]
+        elif op == _OP_AND:
+            mask = args[0] & args[1]
+        elif op == _OP_OR:
+            mask = args[0] | args[1]
+        elif op == _OP_IMPLIES:
+            mask = (full ^ args[0]) | args[1]
+        elif op == _OP_BOX:
+            mask = full ^ _diamond_mask(full ^ args[0], succ, pred)
+        else:  # _OP_DIAMOND
+            mask = _diamond_mask(args[0], succ, pred)
+    memo[formula] = mask
+    return mask
+
+def evaluate_bytecode(model: KripkeModel, code: List[Tuple[int, int]],
+                      props: Tuple[str, ...], world: str) -> bool:
+    """
+    Evaluate formula code produced by `compile_formula` in one world.
+    Lets callers compile a formula once and evaluate it many times.
+    """
+    _require_valid_model(model)
     
-    # Diamond (Possibility) operator: true if formula is true in at least one accessible world
-    elif isinstance(formula, Diamond):
-        accessible_worlds = model.get_accessible_worlds(world)
-        return any(evaluate_formula(model, formula.operand, w) for w in accessible_worlds)
+    if world not in model.W:
+        raise ValueError(f"World '{world}' does not exist in the model")
     
-    else:
-        raise TypeError(f"Unknown formula type: {type(formula)}")
+    inv, succ, pred, prop_val = model._to_bitsets(props)
+    idx, _ = model._index_worlds()
+    return bool(_eval_all(code, prop_val, succ, pred) >> idx[world] & 1)
 
-def evaluate_formula_in_all_worlds(model: KripkeModel, formula: Formula) -> Dict[str, bool]:
+def compile_formula(formula: Formula) -> Tuple[List[Tuple[int, int]], Tuple[str, ...]]:
     """
-    Evaluate a formula in all worlds of the model.
-    Returns a dictionary mapping world names to truth values.
+    Compile a formula to postfix bytecode.
+    Returns (code, props): code is a list of (opcode, arg) pairs, and `arg` of
+    a PROP instruction is the index of its proposition name in `props`.
+    A subformula object occurring several times (see the mk_* factories) is
+    computed once, STOREd in a slot and LOADed at its other occurrences.
     """
-    return {world: evaluate_formula(model, formula, world) for world in model.W}
+    # Pass 1: count the references to each compound node
+    refs: Dict[int, int] = {}
+    todo = [formula]
+    while todo:
+        node = todo.pop()
+        op = getattr(node, "_op", None)
+        if op == _OP_PROP:
+            continue
+        if op is None:
+            raise TypeError(f"Unknown formula type: {type(node)}")
+        k = id(node)
+        refs[k] = refs.get(k, 0) + 1
+        if refs[k] == 1:
+            todo.extend(getattr(node, f) for f in node._fields)
+
+    # Pass 2: iterative post-order walk: (node, children_done)
+    code: List[Tuple[int, int]] = []
+    props: Dict[str, int] = {}
+    slots: Dict[int, int] = {}
+    todo2 = [(formula, False)]
+    while todo2:
+        node, done = todo2.pop()
+        if node._op == _OP_PROP:
+            code.append((_OP_PROP, props.setdefault(node.name, len(props))))
+        elif done:
+            code.append((node._op, 0))
+            if refs[id(node)] > 1:
+                slots[id(node)] = len(slots)
+                code.append((_OP_STORE, slots[id(node)]))
+        elif id(node) in slots:
+            code.append((_OP_LOAD, slots[id(node)]))
+        else:
+            todo2.append((node, True))
+            todo2.extend((getattr(node, f), False) for f in reversed(node._fields))
+    return code, tuple(props)
+
+def codegen_formula(formula: Formula) -> Tuple[Callable[[List[int], List[int], List[int]], int], Tuple[str, ...]]:
+    """
+    Compile a formula to a Python function: (run, props).
+    `run(prop_val, succ, pred)` computes the same bitset as `_eval_all` on
+    the formula's code, as straight-line statements (one per connective)
+    with no interpreter loop. The generated source only holds indices and
+    operators, never proposition names.
+    """
+    code, props = compile_formula(formula)
+    lines = ["def run(prop_val, succ, pred):",
+             "    full = (1 << len(succ)) - 1"]
+    stack: List[str] = []
+    slots: Dict[int, str] = {}
+    for op, arg in code:
+        if op == _OP_PROP:
+            stack.append(f"prop_val[{arg}]")
+            continue
+        if op == _OP_STORE:
+            slots[arg] = stack[-1]
+            continue
+        if op == _OP_LOAD:
+            stack.append(slots[arg])
+            continue
+        if op == _OP_NOT:
+            expr = f"full ^ {stack.pop()}"
+        elif op == _OP_BOX:
+            # □φ = ¬◇¬φ
+            expr = f"full ^ diamond(full ^ {stack.pop()}, succ, pred)"
+        elif op == _OP_DIAMOND:
+            expr = f"diamond({stack.pop()}, succ, pred)"
+        else:
+            right, left = stack.pop(), stack.pop()
+            if op == _OP_AND:
+                expr = f"{left} & {right}"
+            elif op == _OP_OR:
+                expr = f"{left} | {right}"
+            else:  # _OP_IMPLIES
+                expr = f"(full ^ {left}) | {right}"
+        var = f"t{len(lines)}"
+        lines.append(f"    {var} = {expr}")
+        stack.append(var)
+    lines.append(f"    return {stack[0]}")
+    namespace = {"diamond": _diamond_mask}
+    exec("\n".join(lines), namespace)
+    return namespace["run"], props
+
+# Generated function per formula, dropped when the formula is garbage collected
+_function_cache = weakref.WeakKeyDictionary()
+
+def _compiled_function(formula: Formula) -> Tuple[Callable[[List[int], List[int], List[int]], int], Tuple[str, ...]]:
+    """`codegen_formula`, generating each distinct formula's function only once."""
+    compiled = _function_cache.get(formula)
+    if compiled is None:
+        compiled = _function_cache[formula] = codegen_formula(formula)
+    return compiled
+
+def _eval_all(code: List[Tuple[int, int]], prop_val: List[int],
+              succ: List[int], pred: List[int]) -> int:
+    """
+    Run compiled code over the bitset encoding of a model.
+    Every stack entry is the bitset of the worlds where a subformula holds,
+    so each connective is a single int operation over all worlds at once.
+    """
+    full = (1 << len(succ)) - 1
+    stack: List[int] = []
+    slots: Dict[int, int] = {}
+    for op, arg in code:
+        if op == _OP_PROP:
+            stack.append(prop_val[arg])
+        elif op == _OP_NOT:
+            stack[-1] ^= full
+        elif op == _OP_AND:
+            right = stack.pop()
+            stack[-1] &= right
+        elif op == _OP_OR:
+            right = stack.pop()
+            stack[-1] |= right
+        elif op == _OP_IMPLIES:
+            right = stack.pop()
+            stack[-1] = (stack[-1] ^ full) | right
+        elif op == _OP_BOX:
+            # □φ = ¬◇¬φ
+            stack[-1] = full ^ _diamond_mask(full ^ stack[-1], succ, pred)
+        elif op == _OP_DIAMOND:
+            stack[-1] = _diamond_mask(stack[-1], succ, pred)
+        elif op == _OP_STORE:
+            slots[arg] = stack[-1]
+        else:  # _OP_LOAD
+            stack.append(slots[arg])
+    return stack[0]
+
+def _diamond_mask(m: int, succ: List[int], pred: List[int]) -> int:
+    """
+    Bitset of the worlds with a successor in `m`.
+    For a sparse `m`, OR the predecessor rows of its members; otherwise test
+    every world's successor row against `m`.
+    """
+    out = 0
+    if bin(m).count("1") * 2 < len(succ):
+        while m:
+            low = m & -m
+            out |= pred[low.bit_length() - 1]
+            m ^= low
+    else:
+        for i, s in enumerate(succ):
+            if s & m:
+                out |= 1 << i
+    return out
 
 # Main program
 if __name__ == "__main__":
@@ -347,14 +972,14 @@ if __name__ == "__main__":
     
     # Create and evaluate modal formulas
     formulas = [
-        (Prop("p"), "p"),
-        (Not(Prop("p")), "¬p"),
-        (And(Prop("p"), Prop("q")), "p ∧ q"),
-        (Or(Prop("p"), Prop("q")), "p ∨ q"),
-        (Implies(Prop("p"), Prop("q")), "p → q"),
-        (Box(Prop("p")), "□p"),
-        (Diamond(Prop("p")), "◇p"),
-        (Box(Implies(Prop("p"), Prop("q"))), "□(p → q)")
+        (mk_prop("p"), "p"),
+        (mk_not(mk_prop("p")), "¬p"),
+        (mk_and(mk_prop("p"), mk_prop("q")), "p ∧ q"),
+        (mk_or(mk_prop("p"), mk_prop("q")), "p ∨ q"),
+        (mk_implies(mk_prop("p"), mk_prop("q")), "p → q"),
+        (mk_box(mk_prop("p")), "□p"),
+        (mk_diamond(mk_prop("p")), "◇p"),
+        (mk_box(mk_implies(mk_prop("p"), mk_prop("q"))), "□(p → q)")
     ]
     
     print("\nEvaluating Formulas:")
@@ -1,11 +1,106 @@
 import streamlit as st
-from kripke_model import KripkeModel, evaluate_formula_in_all_worlds, parse_simple_formula
+from kripke_model import KripkeModel, evaluate_formula_in_all_worlds, parse_simple_formula, simplify_formula
 from typing import Dict, List, Tuple
-import json
-import pandas as pd
+import io
 import os
 import streamlit.components.v1 as components
 
+# Streamlit reruns the whole script on every interaction: cache the parser
+# and the evaluator so unchanged inputs are not recomputed.
+# cache_resource hands back the parsed tree itself (cache_data would return
+# an unpickled copy), which keeps the parser's shared subformula nodes shared.
+@st.cache_resource(max_entries=256, show_spinner=False)
+def _parse(formula_str: str):
+    # Evaluate (and save) the simplified tree: same truth values, fewer nodes
+    return simplify_formula(parse_simple_formula(formula_str))
+
+@st.cache_resource(max_entries=8)
+def _subformula_memo(model_key) -> dict:
+    # Subformula -> world bitset for one model state, shared by every formula
+    # evaluated on it, so subformulas common to several formulas run once.
+    # Bit i is world i of from_snapshot(model_key), which numbers the worlds
+    # in sorted order: equal keys always mean the same bits.
+    return {}
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _eval(model_key, formula_str: str) -> Dict[str, bool]:
+    # `model_key` is the model's snapshot(): the result depends on the
+    # arguments only, so the cache can be shared safely between sessions
+    model = KripkeModel.from_snapshot(model_key)
+    return evaluate_formula_in_all_worlds(model, _parse(formula_str),
+                                          memo=_subformula_memo(model_key))
+
+@st.cache_data(max_entries=64)
+def _closure(worlds: frozenset, relations: frozenset, reflexive: bool,
+             symmetric: bool, transitive: bool) -> frozenset:
+    # The closures depend only on (W, R): recompute them only for a new frame.
+    # Raises ValueError if R has a pair off W.
+    frame = KripkeModel.from_snapshot((worlds, relations, frozenset(), False))
+    frame.apply_closures(reflexive, symmetric, transitive)
+    return frozenset(frame.R)
+
+def _apply_closures(reflexive: bool = False, symmetric: bool = False,
+                    transitive: bool = False) -> None:
+    # Add the missing pairs of the requested closures to the session's model
+    model = st.session_state.kripke_model
+    closure = _closure(frozenset(model.W), frozenset(model.R), reflexive, symmetric, transitive)
+    for source, target in closure - model.R:
+        model.add_relation(source, target)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _sorted_worlds(worlds: frozenset) -> tuple:
+    # One shared sorted tuple per world set (a tuple: safe to share unchanged)
+    return tuple(sorted(worlds))
+
+# Up to this many rows, a table is drawn as a static st.table, which is
+# lighter to render; longer ones keep the scrollable st.dataframe
+_TABLE_MAX_ROWS = 50
+
+def _show_table(df) -> None:
+    if len(df) <= _TABLE_MAX_ROWS:
+        st.table(df)
+    else:
+        st.dataframe(df)
+
+# json is imported on demand: only Load/Save use it
+@st.cache_data(max_entries=16, show_spinner=False)
+def _model_data(raw: bytes) -> dict:
+    # Parsed upload, keyed on the file's bytes
+    import json
+    return json.loads(raw)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _model_json(model_key) -> str:
+    # JSON download of the model with snapshot `model_key`
+    import json
+    return json.dumps(KripkeModel.from_snapshot(model_key).to_dict(), indent=2)
+
+def _dot_quote(text: str) -> str:
+    # A DOT string literal: backslashes and double quotes escaped
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _model_dot(worlds: tuple, relations: frozenset, valuations: tuple) -> str:
+    # DOT source of the model graph, rebuilt only when the model changes.
+    # `worlds` is sorted and `valuations` holds (prop, value) pairs per world.
+    # Written straight from line templates: st.graphviz_chart takes the source
+    # as a string, so the graphviz package is not needed.
+    buf = io.StringIO()
+    buf.write('digraph {\n\tbgcolor="#1e1b2c" rankdir=LR\n')
+    
+    # Add nodes (worlds)
+    for world, valuation in zip(worlds, valuations):
+        label = "\n".join([world] + [f"{p}:{'T' if v else 'F'}" for p, v in valuation])
+        buf.write('\t%s [label=%s fillcolor="#7357ff" fontcolor=white shape=circle style=filled]\n'
+                  % (_dot_quote(world), _dot_quote(label).replace("\n", "\\n")))
+    
+    # Add edges (relations)
+    for source, target in sorted(relations):
+        buf.write('\t%s -> %s [color=white]\n' % (_dot_quote(source), _dot_quote(target)))
+    
+    buf.write('}\n')
+    return buf.getvalue()
+
 def add_local_logo():
     try:
         # Path to your logo file (in same directory as script)
@@ -40,11 +135,16 @@ def add_local_logo():
         """, unsafe_allow_html=True)
 
 
-# Initialize session state
-if 'kripke_model' not in st.session_state:
+# Start from an empty model with no saved formulas
+def _reset_model_state() -> None:
     st.session_state.kripke_model = KripkeModel()
-if 'formulas' not in st.session_state:
     st.session_state.formulas = []
+    # Strings of the saved formulas, for O(1) duplicate checks
+    st.session_state.formula_strings = set()
+
+# Initialize session state
+if 'kripke_model' not in st.session_state:
+    _reset_model_state()
 
 # Initialisation des états
 if 'est_connecte' not in st.session_state:
@@ -53,23 +153,20 @@ if 'est_connecte' not in st.session_state:
 if "formule" not in st.session_state:
     st.session_state.formule = ""
 
+# Callback of the connector buttons: append `text` to the formula field
+def _insert_in_formula(text: str) -> None:
+    st.session_state.formula_input_field += text
+
 # Fonction pour ajouter un symbole à la formule
 def ajouter_connecteur(symbole):
     st.session_state.formule += symbole
-    st.rerun()
 
-# -------- PAGE DE CONNEXION --------
+# -------- STYLES --------
+# Each page sends its CSS in one st.markdown call per rerun. A rerun drops
+# every element it does not redraw, so the styles cannot be sent only once.
 
-import streamlit as st
-def page_connexion():
-    st.set_page_config(
-        page_title="Logique Modale",
-        page_icon=":brain:",
-        layout="wide"
-    )
-    # Set the dark theme with custom background color
-    st.markdown("""
-    <style>
+_LOGIN_CSS = """
+<style>
     .stApp {
         background-color: #1e1b2c;
         color: white;
@@ -104,20 +201,7 @@ def page_connexion():
         justify-content: center;
         margin-top: 20px;
     }
-    </style>
-    """, unsafe_allow_html=True)
-    
-    # Display logo at top left with improved positioning
-    st.markdown('<div class="logo-container">', unsafe_allow_html=True)
-    st.image("Logo.png", width=120)
-    st.markdown('</div>', unsafe_allow_html=True)
-    
-    # Main content with padding to avoid logo overlap
-    st.markdown('<div class="main-content">', unsafe_allow_html=True)
-    
-    # Updated title styling to match Canva-style caption (3 lines, clear hierarchy)
-    st.markdown("""
-    <style>
+    /* Title block */
     .title-container {
         text-align: center;
         margin-top: 0px;  /* Reduced to move title up */
@@ -141,8 +225,128 @@ def page_connexion():
         color: rgba(255, 255, 255, 0.85);
         line-height: 1.5;
     }
-    </style>
+    /* Gradient button */
+    .stButton button {
+        background: linear-gradient(90deg, #66C6C9) !important;
+        color: white !important;
+        font-weight: bold !important;
+        border: none !important;
+        padding: 8px 16px !important;
+        border-radius: 4px !important;
+    }
+    .stButton button:hover {
+        background: linear-gradient(90deg,  #66C6C9) !important;
+        color: white !important;
+    }
+</style>
+"""
+
+_MAIN_CSS = """
+<style>
+    .stApp {
+        background-color: #1e1b2c;
+        color: white;
+    }
+    .stTextInput > div > div > input {
+        background-color: #2d2b40;
+        color: white;
+    }
+    .stSelectbox > div > div > div {
+        background-color: #2d2b40;
+        color: white;
+    }
+    .stTextInput > label, .stSelectbox > label, .stCheckbox > label {
+        color: white !important;
+    }
+    .stMarkdown {
+        color: white;
+    }
+    div[data-testid="stSubheader"] {
+        color: white;
+    }
+    div[data-testid="stHeader"] {
+        color: white;
+    }
+    .stDataFrame {
+        background-color: #2d2b40;
+    }
+    .stRadio > label {
+        color: white !important;
+    }
+    .stRadio > div {
+        color: white !important;
+    }
+    .stDataFrame [data-testid="stTable"] {
+        color: white;
+    }
+    h1, h2, h3, h4, h5, h6, p {
+        color: white !important;
+    }
+    .st-emotion-cache-183lzff {
+        color: white;
+    }
+    .stSidebar {
+        background-color: #2d2b40;
+    }
+    [data-testid="stSidebar"] {
+        background-color: #2d2b40;
+    }
+    /* Buttons, form submit buttons included */
+    .stButton button, .stFormSubmitButton button {
+        width: 100%;
+        background: linear-gradient(90deg,  #7357ff, #fcacff) !important;
+        color: white !important;
+        font-weight: bold !important;
+        border: none !important;
+    }
+    .stButton button:hover, .stFormSubmitButton button:hover {
+        background: linear-gradient(90deg,  #7357ff, #fcacff) !important;
+    }
+    
+    .stTextInput input {
+        width: 100%;
+        background-color: #2d2b40;
+        color: white;
+    }
+    .stSelectbox select {
+        width: 100%;
+        background-color: #2d2b40;
+        color: white;
+    }
+    .formula-display {
+        font-family: monospace;
+        font-size: 1.2em;
+        padding: 10px;
+        background-color: #2d2b40;
+        border-radius: 5px;
+        margin: 5px 0;
+        color: white;
+    }
+</style>
+"""
+
+# -------- PAGE DE CONNEXION --------
+
+import streamlit as st
+def page_connexion():
+    st.set_page_config(
+        page_title="Logique Modale",
+        page_icon=":brain:",
+        layout="wide"
+    )
+    # Set the dark theme, the title and the button styles
+    st.markdown(_LOGIN_CSS, unsafe_allow_html=True)
+    
+    # Display logo at top left with improved positioning
+    st.markdown('<div class="logo-container">', unsafe_allow_html=True)
+    st.image("Logo.png", width=120)
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Main content with padding to avoid logo overlap
+    st.markdown('<div class="main-content">', unsafe_allow_html=True)
     
+    # Updated title styling to match Canva-style caption (3 lines, clear hierarchy)
+    st.markdown("""
     <div class="title-container">
         <div class="main-title">
             Master modal logic<br>
@@ -157,24 +361,6 @@ def page_connexion():
     # Login input with better spacing
     nom = st.text_input(label="", placeholder="Enter your Username")
     
-    # Custom CSS for gradient button
-    st.markdown("""
-    <style>
-    .stButton button {
-        background: linear-gradient(90deg, #66C6C9) !important;
-        color: white !important;
-        font-weight: bold !important;
-        border: none !important;
-        padding: 8px 16px !important;
-        border-radius: 4px !important;
-    }
-    .stButton button:hover {
-        background: linear-gradient(90deg,  #66C6C9) !important;
-        color: white !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
     st.markdown('<div class="login-button-container">', unsafe_allow_html=True)
     col1, col2, col3,col4,col5 = st.columns([1, 1, 1,1,1])
 
@@ -198,108 +384,11 @@ def main():
         layout="wide"
     )
 
-    # Set the dark theme with custom background color
-    st.markdown("""
-    <style>
-        .stApp {
-            background-color: #1e1b2c;
-            color: white;
-        }
-        .stTextInput > div > div > input {
-            background-color: #2d2b40;
-            color: white;
-        }
-        .stSelectbox > div > div > div {
-            background-color: #2d2b40;
-            color: white;
-        }
-        .stTextInput > label, .stSelectbox > label, .stCheckbox > label {
-            color: white !important;
-        }
-        .stMarkdown {
-            color: white;
-        }
-        div[data-testid="stSubheader"] {
-            color: white;
-        }
-        div[data-testid="stHeader"] {
-            color: white;
-        }
-        .stDataFrame {
-            background-color: #2d2b40;
-        }
-        .stRadio > label {
-            color: white !important;
-        }
-        .stRadio > div {
-            color: white !important;
-        }
-        .stDataFrame [data-testid="stTable"] {
-            color: white;
-        }
-        div.stButton > button {
-            background: linear-gradient(90deg,  #7357ff, #fcacff);
-            color: white;
-            font-weight: bold;
-            border: none;
-        }
-        div.stButton > button:hover {
-            background: linear-gradient(90deg,  #7357ff, #fcacff);
-        }
-        
-        h1, h2, h3, h4, h5, h6, p {
-            color: white !important;
-        }
-        .st-emotion-cache-183lzff {
-            color: white;
-        }
-        .stSidebar {
-            background-color: #2d2b40;
-        }
-        [data-testid="stSidebar"] {
-            background-color: #2d2b40;
-        }
-    </style>
-    """, unsafe_allow_html=True)
+    # Set the dark theme with custom background color and the gradient buttons
+    st.markdown(_MAIN_CSS, unsafe_allow_html=True)
 
     st.markdown(f"<h2 style='text-align: center; color: white;'>Welcome {st.session_state.nom_utilisateur} </h2>", unsafe_allow_html=True)
 
-    # Add custom CSS for styling with the gradient buttons
-    st.markdown("""
-    <style>
-        .stButton button {
-            width: 100%;
-            background: linear-gradient(90deg,  #7357ff, #fcacff) !important;
-            color: white !important;
-            font-weight: bold !important;
-            border: none !important;
-        }
-        .stButton button:hover {
-            background: linear-gradient(90deg,  #7357ff, #fcacff) !important;
-        }
-        
-        .stTextInput input {
-            width: 100%;
-            background-color: #2d2b40;
-            color: white;
-        }
-        .stSelectbox select {
-            width: 100%;
-            background-color: #2d2b40;
-            color: white;
-        }
-        .formula-display {
-            font-family: monospace;
-            font-size: 1.2em;
-            padding: 10px;
-            background-color: #2d2b40;
-            border-radius: 5px;
-            margin: 5px 0;
-            color: white;
-        }
-    </style>
-    """, unsafe_allow_html=True)
-
     # Sidebar with model management
     with st.sidebar:
         add_local_logo()
@@ -310,23 +399,26 @@ def main():
         
         if model_action == "Create New Model":
             if st.button("Initialize New Model"):
-                st.session_state.kripke_model = KripkeModel()
-                st.session_state.formulas = []
+                _reset_model_state()
                 st.success("New model created!")
         
         elif model_action == "Load Model":
             uploaded_file = st.file_uploader("Upload JSON model", type="json")
             if uploaded_file is not None:
                 try:
-                    data = json.load(uploaded_file)
-                    st.session_state.kripke_model = KripkeModel.from_dict(data)
+                    # The upload stays in the widget across reruns: load it
+                    # once, or later reruns would overwrite the user's edits
+                    if st.session_state.get("loaded_file_id") != uploaded_file.file_id:
+                        data = _model_data(uploaded_file.getvalue())
+                        st.session_state.kripke_model = KripkeModel.from_dict(data)
+                        st.session_state.loaded_file_id = uploaded_file.file_id
                     st.success("Model loaded successfully!")
                 except Exception as e:
                     st.error(f"Error loading model: {e}")
         
         elif model_action == "Save Model":
             if st.button("Download Current Model"):
-                model_json = json.dumps(st.session_state.kripke_model.to_dict(), indent=2)
+                model_json = _model_json(st.session_state.kripke_model.snapshot())
                 st.download_button(
                     label="Download Model as JSON",
                     data=model_json,
@@ -335,246 +427,224 @@ def main():
                 )
 
     # Main content area
-    
+    # The sidebar above may replace the model; below, only its contents change
+    model = st.session_state.kripke_model
     
     st.header("Build Your Kripke Model")
             
     # World management
     st.subheader("Worlds")
     col1, col2 = st.columns(2)
+    # Forms: editing their widgets does not rerun the page, only submitting does
     with col1:
-        new_world = st.text_input("Add new world:")
-        if st.button("Add World") and new_world:
-            if new_world in st.session_state.kripke_model.W:
-                st.warning(f"World '{new_world}' already exists.")
-            else:
-                try:
-                    st.session_state.kripke_model.add_world(new_world)
-                    st.success(f"World '{new_world}' added!")
-                except Exception as e:
-                    st.error(str(e))
+        with st.form("add_world_form"):
+            new_world = st.text_input("Add new world:")
+            if st.form_submit_button("Add World") and new_world:
+                if new_world in model.W:
+                    st.warning(f"World '{new_world}' already exists.")
+                else:
+                    try:
+                        model.add_world(new_world)
+                        st.success(f"World '{new_world}' added!")
+                    except Exception as e:
+                        st.error(str(e))
             
     with col2:
-        if st.session_state.kripke_model.W:
-            world_to_remove = st.selectbox("Remove world:", sorted(st.session_state.kripke_model.W))
-            if st.button("Remove World"):
-                try:
-                    st.session_state.kripke_model.remove_world(world_to_remove)
-                    st.success(f"World '{world_to_remove}' removed!")
-                except Exception as e:
-                    st.error(str(e))
+        if model.W:
+            with st.form("remove_world_form"):
+                world_to_remove = st.selectbox("Remove world:", _sorted_worlds(frozenset(model.W)))
+                if st.form_submit_button("Remove World"):
+                    try:
+                        model.remove_world(world_to_remove)
+                        st.success(f"World '{world_to_remove}' removed!")
+                    except Exception as e:
+                        st.error(str(e))
             
+    # The worlds change only above this point: sort them once for the rest of the page
+    sorted_W = _sorted_worlds(frozenset(model.W))
+
     # Relation management
     st.subheader("Accessibility Relations")
-    if len(st.session_state.kripke_model.W) >= 2:
-        col1, col2 = st.columns(2)
-        with col1:
-            source_world = st.selectbox("From world:", sorted(st.session_state.kripke_model.W))
-        with col2:
-            target_world = st.selectbox("To world:", sorted(st.session_state.kripke_model.W))
-            
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("Add Relation"):
-                try:
-                    st.session_state.kripke_model.add_relation(source_world, target_world)
-                    st.success(f"Relation {source_world}→{target_world} added!")
-                except Exception as e:
-                    st.error(str(e))
-        with col2:
-            if st.button("Remove Relation"):
-                try:
-                    st.session_state.kripke_model.remove_relation(source_world, target_world)
-                    st.success(f"Relation {source_world}→{target_world} removed!")
-                except Exception as e:
-                    st.error(str(e))
+    if len(model.W) >= 2:
+        with st.form("relation_form"):
+            col1, col2 = st.columns(2)
+            with col1:
+                source_world = st.selectbox("From world:", sorted_W)
+            with col2:
+                target_world = st.selectbox("To world:", sorted_W)
+                
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.form_submit_button("Add Relation"):
+                    try:
+                        model.add_relation(source_world, target_world)
+                        st.success(f"Relation {source_world}→{target_world} added!")
+                    except Exception as e:
+                        st.error(str(e))
+            with col2:
+                if st.form_submit_button("Remove Relation"):
+                    try:
+                        model.remove_relation(source_world, target_world)
+                        st.success(f"Relation {source_world}→{target_world} removed!")
+                    except Exception as e:
+                        st.error(str(e))
             
         # Relation properties
         st.subheader("Relation Properties")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            if st.button("Make Reflexive"):
-                st.session_state.kripke_model.make_relation_reflexive()
-                st.success("All worlds now access themselves")
-        with col2:
-            if st.button("Make Symmetric"):
-                st.session_state.kripke_model.make_relation_symmetric()
-                st.success("All relations now bidirectional")
-        with col3:
-            if st.button("Make Transitive"):
-                st.session_state.kripke_model.make_relation_transitive()
-                st.success("Relations now transitive")
+        # One form: picking e.g. all three (an S5 frame) costs a single rerun
+        with st.form("relation_properties_form"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                reflexive = st.checkbox("Reflexive")
+            with col2:
+                symmetric = st.checkbox("Symmetric")
+            with col3:
+                transitive = st.checkbox("Transitive")
+            if st.form_submit_button("Apply"):
+                # Applied reflexive, then symmetric, then transitive
+                try:
+                    _apply_closures(reflexive, symmetric, transitive)
+                    if reflexive:
+                        st.success("All worlds now access themselves")
+                    if symmetric:
+                        st.success("All relations now bidirectional")
+                    if transitive:
+                        st.success("Relations now transitive")
+                except ValueError as e:
+                    st.error(str(e))
             
     # Valuation management
     st.subheader("Valuations")
-    if st.session_state.kripke_model.W:
-        selected_world = st.selectbox("Select world for valuation:", sorted(st.session_state.kripke_model.W))
-        prop_name = st.text_input("Proposition name (e.g., 'p', 'q'):")
-        prop_value = st.checkbox("Truth value", value=True)
+    if model.W:
+        with st.form("valuation_form"):
+            selected_world = st.selectbox("Select world for valuation:", sorted_W)
+            prop_name = st.text_input("Proposition name (e.g., 'p', 'q'):")
+            prop_value = st.checkbox("Truth value", value=True)
+            set_valuation = st.form_submit_button("Set Valuation")
             
-        if st.button("Set Valuation"):
+        if set_valuation:
             try:
-                st.session_state.kripke_model.set_valuation(selected_world, prop_name, prop_value)
+                model.set_valuation(selected_world, prop_name, prop_value)
                 st.success(f"Set {prop_name}={prop_value} in {selected_world}")
             except Exception as e:
                 st.error(str(e))
                 
             # Show current valuations
             st.markdown("**Current Valuations:**")
-            valuations = []
-            for world in sorted(st.session_state.kripke_model.W):
-                for prop, value in st.session_state.kripke_model.V.get(world, {}).items():
-                    valuations.append({
-                        "World": world,
-                        "Proposition": prop,
-                        "Value": "True" if value else "False"
-                    })
-            if valuations:
-                st.dataframe(pd.DataFrame(valuations))
+            # Build the table column by column; World/Proposition repeat a lot
+            worlds, props, values = [], [], []
+            for world in sorted_W:
+                valuation = model.V.get(world, {})
+                worlds.extend([world] * len(valuation))
+                props.extend(valuation)
+                values.extend("True" if value else "False" for value in valuation.values())
+            if worlds:
+                import pandas as pd  # imported on demand, like json
+                _show_table(pd.DataFrame({
+                    "World": pd.Categorical(worlds),
+                    "Proposition": pd.Categorical(props),
+                    "Value": values
+                }))
             else:
                 st.info("No valuations set yet")
 
     # Evaluation section
     st.subheader("Evaluate Modal Formulas")
         
-    # Initialize formula_input in session state if it doesn't exist
-    if 'formula_input' not in st.session_state:
-        st.session_state.formula_input = ""
+    # Initialize the formula field in session state if it doesn't exist
+    if 'formula_input_field' not in st.session_state:
+        st.session_state.formula_input_field = ""
 
 # Create buttons for logical connectors
-    st.markdown("**Insert connectors:**")
-    cols = st.columns(7)
-    with cols[0]:
-            not_btn = st.button("¬ (NOT)")
-    with cols[1]:
-        and_btn = st.button("∧ (AND)")
-    with cols[2]:
-        or_btn = st.button("∨ (OR)")
-    with cols[3]:
-        implies_btn = st.button("→ (IMPLIES)")
-    with cols[4]:
-        box_btn = st.button("□ (BOX)")
-    with cols[5]:
-        diamond_btn = st.button("◇ (DIAMOND)")
-    with cols[6]:
-        parens_btn = st.button("( )")
-
-    st.markdown("**Insert propositions:**")
-    prop_cols = st.columns(2)
-    with prop_cols[0]:
-        p_btn = st.button("p")
-    with prop_cols[1]:
-        q_btn = st.button("q")
-
-# Handle button presses
-    if not_btn:
-        st.session_state.formula_input += "¬"
-    if and_btn:
-        st.session_state.formula_input += " ∧ "
-    if or_btn:
-        st.session_state.formula_input += " ∨ "
-    if implies_btn:
-        st.session_state.formula_input += " → "
-    if box_btn:
-        st.session_state.formula_input += "□"
-    if diamond_btn:
-        st.session_state.formula_input += "◇"
-    if parens_btn:
-        st.session_state.formula_input += "()"
-    if p_btn:
-        st.session_state.formula_input += "p"
-    if q_btn:
-        st.session_state.formula_input += "q"
-
-# Formula input that syncs with both keyboard and button inputs
-    formula_input = st.text_input(
-        "Enter a modal logic formula:",
-        value=st.session_state.formula_input,
-        help="Use p, q for propositions; ¬ for NOT; ∧ for AND; ∨ for OR; → for IMPLIES; □ for BOX; ◇ for DIAMOND",
-        key="formula_input_field",
-        on_change=lambda: setattr(st.session_state, 'formula_input', st.session_state.formula_input_field)
-)
-
-# This ensures the session state stays in sync when typing
-    if formula_input != st.session_state.formula_input:
-        st.session_state.formula_input = formula_input
-        
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("Evaluate Formula"):
-            if formula_input:
-                try:
-                    formula = parse_simple_formula(formula_input)
-                    results = evaluate_formula_in_all_worlds(st.session_state.kripke_model, formula)
-                    
-                    # Display results
-                    st.markdown("**Evaluation Results:**")
-                    result_data = []
-                    for world, value in results.items():
-                        result_data.append({
-                            "World": world,
-                            "Result": "True" if value else "False"
-                        })
-                    st.dataframe(pd.DataFrame(result_data))
-                    
-                    # Add to saved formulas
-                    if formula_input not in [f[1] for f in st.session_state.formulas]:
-                        st.session_state.formulas.append((formula, formula_input))
-                except Exception as e:
-                    st.error(f"Error evaluating formula: {e}")
-            else:
-                st.warning("Please enter a formula first")
+    # The connectors, the field and Evaluate share one form: a click submits
+    # the typed text with it, and the on_click callback then appends its
+    # symbol before the rerun, so the field is drawn already updated.
+    # Enter would press the form's first submit button ("¬"), so it is off
+    with st.form("formula_builder", clear_on_submit=False, enter_to_submit=False):
+        st.markdown("**Insert connectors:**")
+        cols = st.columns(7)
+        with cols[0]:
+            st.form_submit_button("¬ (NOT)", on_click=_insert_in_formula, args=("¬",))
+        with cols[1]:
+            st.form_submit_button("∧ (AND)", on_click=_insert_in_formula, args=(" ∧ ",))
+        with cols[2]:
+            st.form_submit_button("∨ (OR)", on_click=_insert_in_formula, args=(" ∨ ",))
+        with cols[3]:
+            st.form_submit_button("→ (IMPLIES)", on_click=_insert_in_formula, args=(" → ",))
+        with cols[4]:
+            st.form_submit_button("□ (BOX)", on_click=_insert_in_formula, args=("□",))
+        with cols[5]:
+            st.form_submit_button("◇ (DIAMOND)", on_click=_insert_in_formula, args=("◇",))
+        with cols[6]:
+            st.form_submit_button("( )", on_click=_insert_in_formula, args=("()",))
+
+        st.markdown("**Insert propositions:**")
+        prop_cols = st.columns(2)
+        with prop_cols[0]:
+            st.form_submit_button("p", on_click=_insert_in_formula, args=("p",))
+        with prop_cols[1]:
+            st.form_submit_button("q", on_click=_insert_in_formula, args=("q",))
+
+        # Formula input that syncs with both keyboard and button inputs
+        formula_input = st.text_input(
+            "Enter a modal logic formula:",
+            help="Use p, q for propositions; ¬ for NOT; ∧ for AND; ∨ for OR; → for IMPLIES; □ for BOX; ◇ for DIAMOND",
+            key="formula_input_field"
+        )
             
+        evaluate = st.form_submit_button("Evaluate Formula")
+
+    if evaluate:
+        if formula_input:
+            try:
+                formula = _parse(formula_input)
+                results = _eval(model.snapshot(), formula_input)
+                
+                # Display results
+                st.markdown("**Evaluation Results:**")
+                if results:
+                    import pandas as pd
+                    _show_table(pd.DataFrame({
+                        "World": list(results),
+                        "Result": ["True" if value else "False" for value in results.values()]
+                    }))
+                else:
+                    st.info("The model has no worlds to evaluate the formula in")
+                
+                # Add to saved formulas
+                if formula_input not in st.session_state.formula_strings:
+                    st.session_state.formulas.append((formula, formula_input))
+                    st.session_state.formula_strings.add(formula_input)
+            except Exception as e:
+                st.error(f"Error evaluating formula: {e}")
+        else:
+            st.warning("Please enter a formula first")
+        
 
     # Model visualization
     st.subheader("Model Visualization")
             
-    if not st.session_state.kripke_model.W:
-        st.info("Model has no worlds yet. Add some in the Model Builder tab.")
-    else:
-        # Display model structure
-        st.subheader("Current Model Structure")
-        st.code(str(st.session_state.kripke_model))
-            
-        # Graph visualization (using graphviz)
-        try:
-            from graphviz import Digraph
-            
-            dot = Digraph()
-            dot.attr(rankdir='LR', bgcolor='#1e1b2c')
-            
-            # Add nodes (worlds)
-            for world in sorted(st.session_state.kripke_model.W):
-                # Get valuations for this world
-                valuations = st.session_state.kripke_model.V.get(world, {})
-                val_str = "\n".join([f"{p}:{'T' if v else 'F'}" for p, v in valuations.items()])
-                
-                dot.node(world, 
-                        label=f"{world}\n{val_str}" if val_str else world,
-                        shape='circle',
-                        style='filled',
-                        fillcolor='#7357ff',
-                        fontcolor='white')
-            
-            # Add edges (relations)
-            for source, target in st.session_state.kripke_model.R:
-                dot.edge(source, target, color='white')
-            
-            st.graphviz_chart(dot)
+    # A collapsed st.expander would still run its body on every rerun: a
+    # toggle skips the structure text and the graph while they are hidden
+    if st.toggle("Show model visualization", value=False):
+        if not model.W:
+            st.info("Model has no worlds yet. Add some in the Model Builder tab.")
+        else:
+            # Display model structure
+            st.subheader("Current Model Structure")
+            st.code(str(model))
             
-        except ImportError:
-            st.warning("For graph visualization, please install graphviz: pip install graphviz")
-            st.write("Here's a text representation of the relations:")
-            relations = sorted(st.session_state.kripke_model.R)
-            st.write(" → ".join([f"{source}→{target}" for source, target in relations]) or "No relations")
+            # Graph visualization (rendered by the browser from DOT source)
+            valuations = tuple(tuple(model.V.get(world, {}).items()) for world in sorted_W)
+            st.graphviz_chart(_model_dot(sorted_W, frozenset(model.R), valuations))
 
     
     col1, col2, col3 = st.columns([1, 1, 1])
     with col3:
         if st.button("Disconnect"):
-            st.session_state.est_connecte = False
-            st.session_state.nom_utilisateur = ""
-            st.session_state.formule = ""
+            # Drop the whole session (user, model, saved formulas, widget
+            # values) at once: the next run re-initializes it from scratch
+            st.session_state.clear()
             st.rerun()
             
 